@@ -1,6 +1,13 @@
-import requests
+import argparse
+import aiohttp
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from aiolimiter import AsyncLimiter
+import asyncio
 import csv
 from datetime import datetime
+import json
+import orjson
+import os
 import time
 
 # Configuração
@@ -10,191 +17,552 @@ HEADERS = {
     "Accept": "application/vnd.github.v3+json"
 }
 BASE_URL = "https://api.github.com"
+GRAPHQL_URL = f"{BASE_URL}/graphql"
 CSV_FILE = "../relatorios/github_pr_data.csv"
+CACHE_FILE = "gh_cache"  # Cache SQLite das respostas da API, reaproveitado entre execuções
+CACHE_EXPIRE_AFTER = 86400  # Validade das respostas em cache (segundos)
+REPOS_CACHE_FILE = "repos_cache.json"  # Lista de repositórios já filtrados, reaproveitada por CACHE_EXPIRE_AFTER
+CHECKPOINT_FILE = "checkpoint.json"  # Progresso da coleta, usado para retomar uma execução interrompida
 REPOS_LIMIT = 200  # Limite original de repositórios
 PRS_LIMIT = 25  # Limite original de PRs por repositório
 MAX_RETRIES = 3  # Número máximo de tentativas para cada requisição
+BACKOFF_FACTOR = 0.5  # Espera base (segundos) entre tentativas após falhas transitórias
+RETRY_STATUS = (502, 503, 504)  # Status HTTP considerados falhas transitórias
+CSV_QUEUE_SIZE = 20  # Máximo de rodadas (linhas + progresso) aguardando escrita na fila do CSV
+CSV_BUFFER_SIZE = 1 << 20  # Buffer de 1 MiB do arquivo CSV, para reduzir chamadas de escrita
+KEEPALIVE_TIMEOUT = 60  # Tempo (segundos) que conexões ociosas ficam abertas para reuso
 MIN_PRS_COUNT = 100  # Mínimo de PRs fechados ou mesclados
-
-
-def fazer_requisicao_com_retry(url, headers, max_retries=MAX_RETRIES):
+MAX_CONCURRENCY = 20  # Máximo de requisições simultâneas à API
+# O limite da API GraphQL é de 5000 pontos por hora, e cada consulta de um lote custa alguns pontos
+# (um por 100 nós pedidos), então o ritmo fica bem abaixo de 5000 requisições
+RATE_LIMIT = 900  # Requisições à API por hora (respostas do cache não contam)
+GRAPHQL_BATCH_SIZE = 20  # Repositórios consultados em cada requisição GraphQL
+GRAPHQL_MAX_PAGE_SIZE = 100  # Maior valor aceito pela API GraphQL em first/last
+MAX_CONCURRENT_BATCHES = 5  # Lotes de repositórios coletados ao mesmo tempo
+
+COLUNAS = ("repo_name", "pr_number", "num_files_changed", "lines_added", "lines_removed",
+           "review_time_in_hours", "pr_description_length", "num_comments", "num_participants", "pr_status")
+
+SEMAFORO = asyncio.Semaphore(MAX_CONCURRENCY)
+SEMAFORO_LOTES = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+# Um único token por vez: as requisições ficam espaçadas em 3600 / RATE_LIMIT segundos, sem rajada inicial
+LIMITADOR = AsyncLimiter(1, 3600 / RATE_LIMIT)
+
+
+CONSULTA_REPOSITORIOS = """
+query($cursor: String) {
+  search(type: REPOSITORY, query: "stars:>1 sort:stars-desc", first: 100, after: $cursor) {
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      ... on Repository {
+        nameWithOwner
+        pullRequests(states: [CLOSED, MERGED]) { totalCount }
+      }
+    }
+  }
+}"""
+
+CONSULTA_PRS_REPOSITORIO = """
+  r{indice}: repository(owner: $owner{indice}, name: $name{indice}) {{
+    pullRequests(states: [CLOSED, MERGED], last: {limite}, before: $cursor{indice}) {{
+      pageInfo {{ hasPreviousPage startCursor }}
+      nodes {{
+        number
+        changedFiles
+        additions
+        deletions
+        createdAt
+        closedAt
+        mergedAt
+        body
+        comments {{ totalCount }}
+        author {{ login }}
+        reviews(first: 100) {{ totalCount nodes {{ author {{ login }} }} }}
+      }}
+    }}
+  }}"""
+
+
+async def fazer_requisicao_com_retry(session, url, max_retries=MAX_RETRIES, method="GET", corpo=None):
     """
-    Faz uma requisição com retry em caso de erro 403 (limite de taxa).
+    Faz uma requisição com retry em caso de limite de taxa (erro 403, ou erro RATE_LIMITED da API GraphQL,
+    que chega com status 200) ou de falhas transitórias (erros 502/503/504 e de conexão), com backoff
+    exponencial. Retorna o corpo JSON decodificado.
     """
     for tentativa in range(max_retries):
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-
-            # Verificar o limite de requisições restantes
-            remaining = int(response.headers.get('X-RateLimit-Remaining', 0))
-            reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-            if remaining < 10:
-                # Se estiver perto de estourar o limite, aguarda até o reset
-                sleep_time = max(reset_time - time.time(), 0) + 1
-                print(f"Limite de taxa próximo. Aguardando {sleep_time:.2f} segundos.")
-                time.sleep(sleep_time)
-
-            return response
-        except requests.HTTPError as e:
-            if e.response.status_code == 403:
-                reset_time = int(e.response.headers.get('X-RateLimit-Reset', 0))
-                sleep_time = max(reset_time - time.time(), 0) + 1
-                print(f"Limite de taxa atingido. Aguardando {sleep_time:.2f} segundos.")
-                time.sleep(sleep_time)
+            async with SEMAFORO:
+                async with session.request(method, url, json=corpo) as response:
+                    response.raise_for_status()
+                    # orjson decodifica os bytes da resposta bem mais rápido que o módulo json da biblioteca padrão
+                    dados = orjson.loads(await response.read())
+                # Só o que chegou à API consome o limite: a vaga do semáforo é mantida até o limitador liberar o
+                # próximo intervalo, o que espaça as requisições reais ao longo da hora e deixa o cache livre
+                if not getattr(response, "from_cache", False):
+                    await LIMITADOR.acquire()
+            if limite_graphql_atingido(dados):
+                await aguardar_reset(response.headers)
+                continue
+            return dados
+        except aiohttp.ClientResponseError as e:
+            if e.status == 403:
+                await aguardar_reset(e.headers)
+            elif e.status in RETRY_STATUS:
+                await aguardar_backoff(tentativa, e)
             else:
                 raise
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            await aguardar_backoff(tentativa, e)
     raise Exception(f"Falha após {max_retries} tentativas")
 
 
+def limite_graphql_atingido(dados):
+    """
+    Indica se a resposta da API GraphQL foi recusada por limite de taxa.
+    """
+    return isinstance(dados, dict) and any(erro.get("type") == "RATE_LIMITED" for erro in dados.get("errors") or [])
+
+
+async def aguardar_reset(headers):
+    """
+    Aguarda até o horário de renovação do limite de taxa informado no cabeçalho X-RateLimit-Reset.
+    """
+    reset_time = int((headers or {}).get('X-RateLimit-Reset', 0))
+    sleep_time = max(reset_time - time.time(), 0) + 1
+    print(f"Limite de taxa atingido. Aguardando {sleep_time:.2f} segundos.")
+    await asyncio.sleep(sleep_time)
+
+
+async def aguardar_backoff(tentativa, erro):
+    """
+    Aguarda um tempo crescente (0.5s, 1s, 2s, ...) antes de uma nova tentativa.
+    """
+    sleep_time = BACKOFF_FACTOR * (2 ** tentativa)
+    print(f"Falha transitória ({erro}). Nova tentativa em {sleep_time:.2f} segundos.")
+    await asyncio.sleep(sleep_time)
+
+
+class ErroGraphQL(Exception):
+    """
+    A API GraphQL respondeu sem dados (por exemplo, limite de taxa ou erro na consulta).
+    """
+
+
+async def fazer_consulta_graphql(session, query, variables):
+    """
+    Executa uma consulta na API GraphQL do GitHub e retorna o campo "data" da resposta.
+    Levanta ErroGraphQL se a resposta não trouxer dados; erros parciais (como um repositório
+    não encontrado) aparecem apenas como aliases nulos em "data".
+    """
+    resultado = await fazer_requisicao_com_retry(session, GRAPHQL_URL, method="POST",
+                                                 corpo={"query": query, "variables": variables})
+    erros = resultado.get("errors") or []
+    for erro in erros:
+        print(f"Erro na consulta GraphQL: {erro.get('type')} {erro.get('message')}")
+    if resultado.get("data") is None:
+        tipos = ", ".join(sorted({str(erro.get("type")) for erro in erros})) or "resposta sem dados"
+        raise ErroGraphQL(f"Consulta GraphQL sem dados ({tipos})")
+    return resultado["data"]
+
+
+def montar_consulta_prs(cursores, limite=PRS_LIMIT):
+    """
+    Monta uma única consulta GraphQL que busca os PRs fechados ou mesclados de vários repositórios,
+    usando um alias (r0, r1, ...) para cada repositório. O limite de PRs define o tamanho da página,
+    respeitando o máximo da API; limites maiores são atingidos paginando.
+    """
+    tamanho_pagina = min(limite, GRAPHQL_MAX_PAGE_SIZE)
+    declaracoes = []
+    campos = []
+    variables = {}
+    for indice, (repo_name, cursor) in enumerate(cursores.items()):
+        owner, name = repo_name.split("/", 1)
+        declaracoes.append(f"$owner{indice}: String!, $name{indice}: String!, $cursor{indice}: String")
+        campos.append(CONSULTA_PRS_REPOSITORIO.format(indice=indice, limite=tamanho_pagina))
+        variables[f"owner{indice}"] = owner
+        variables[f"name{indice}"] = name
+        variables[f"cursor{indice}"] = cursor
+    query = f"query({', '.join(declaracoes)}) {{{''.join(campos)}\n}}"
+    return query, variables
+
+
+def converter_data(data):
+    """
+    Converte uma data no formato fixo da API do GitHub ("AAAA-MM-DDTHH:MM:SSZ") em datetime.
+    Fatiar a string é bem mais rápido que datetime.strptime para esse formato conhecido.
+    """
+    return datetime(int(data[0:4]), int(data[5:7]), int(data[8:10]),
+                    int(data[11:13]), int(data[14:16]), int(data[17:19]))
+
+
 def coletar_dados_pr(repo_name, pr):
     """
-    Coleta dados de um pull request específico.
+    Coleta dados de um pull request específico a partir do nó retornado pela API GraphQL.
+    Retorna uma tupla na ordem de COLUNAS, ou None se o PR não passar nos filtros.
     """
     pr_number = pr["number"]
-    pr_url = pr["url"]
 
     try:
-        pr_response = fazer_requisicao_com_retry(pr_url, HEADERS)
-        pr_data = pr_response.json()
-
-        reviews_url = f"{pr_url}/reviews"
-        reviews_response = fazer_requisicao_com_retry(reviews_url, HEADERS)
-        reviews = reviews_response.json()
-
-        if len(reviews) == 0:
+        # Filtros baratos primeiro: só percorre as revisões dos PRs que serão mantidos
+        if pr["reviews"]["totalCount"] == 0:
             return None
 
-        created_at = datetime.strptime(pr_data["created_at"], "%Y-%m-%dT%H:%M:%SZ")
-        closed_at = datetime.strptime(pr_data["closed_at"], "%Y-%m-%dT%H:%M:%SZ")
+        created_at = converter_data(pr["createdAt"])
+        closed_at = converter_data(pr["closedAt"])
         review_time = (closed_at - created_at).total_seconds() / 3600
 
         if review_time < 1:
             return None
 
         # Coletar os logins dos participantes de forma segura
-        participants = set()
-        if pr_data.get("user") and pr_data["user"].get("login"):
-            participants.add(pr_data["user"]["login"])
-        for review in reviews:
-            if review.get("user") and review["user"]["login"]:
-                participants.add(review["user"]["login"])
+        autor = (pr.get("author") or {}).get("login")
+        participants = ({autor} if autor else set()) | {
+            review["author"]["login"] for review in pr["reviews"]["nodes"]
+            if review.get("author") and review["author"]["login"]
+        }
 
         # Verificar se o PR foi merged ou apenas fechado
-        pr_status = "merged" if pr_data.get("merged_at") else "closed"
-
-        return {
-            "repo_name": repo_name,
-            "pr_number": pr_number,
-            "num_files_changed": pr_data["changed_files"],
-            "lines_added": pr_data["additions"],
-            "lines_removed": pr_data["deletions"],
-            "review_time_in_hours": review_time,
-            "pr_description_length": len(pr_data.get("body") or ""),
-            "num_comments": pr_data["comments"],
-            "num_participants": len(participants),
-            "pr_status": pr_status  # Status final do PR (merged/closed)
-        }
-    except requests.RequestException as e:
-        print(f"Erro ao coletar dados do PR {pr_number} do repositório {repo_name}: {e}")
-        return None
+        pr_status = "merged" if pr.get("mergedAt") else "closed"
+
+        # Mesma ordem de COLUNAS
+        return (
+            repo_name,
+            pr_number,
+            pr["changedFiles"],
+            pr["additions"],
+            pr["deletions"],
+            review_time,
+            len(pr.get("body") or ""),
+            pr["comments"]["totalCount"],
+            len(participants),
+            pr_status  # Status final do PR (merged/closed)
+        )
     except KeyError as e:
         print(f"Erro ao acessar dados do PR {pr_number} do repositório {repo_name}: Chave {e} não encontrada")
         return None
 
 
-def buscar_repositorios_populares(quantidade=REPOS_LIMIT):
+async def buscar_repositorios_populares(session, quantidade=REPOS_LIMIT, min_prs=MIN_PRS_COUNT):
     """
-    Busca os repositórios mais populares do GitHub que tenham ao menos 100 PRs fechados ou mesclados.
+    Busca os repositórios mais populares do GitHub que tenham ao menos min_prs PRs fechados ou mesclados.
+    O total de PRs vem na própria busca GraphQL, sem requisições extras por repositório.
     """
+    repos = carregar_repositorios_salvos(quantidade, min_prs)
+    if repos is not None:
+        print(f"Usando os {len(repos)} repositórios salvos em {REPOS_CACHE_FILE}")
+        return repos
+
     print(
-        f"Buscando os {quantidade} repositórios mais populares com pelo menos {MIN_PRS_COUNT} PRs (fechados ou mesclados)...")
+        f"Buscando os {quantidade} repositórios mais populares com pelo menos {min_prs} PRs (fechados ou mesclados)...")
     repos = []
-    page = 1
+    vistos = set()
+    cursor = None
     while len(repos) < quantidade:
-        url = f"{BASE_URL}/search/repositories?q=stars:>1&sort=stars&order=desc&per_page=100&page={page}"
         try:
-            response = fazer_requisicao_com_retry(url, HEADERS)
-            data = response.json()
-            for repo in data["items"]:
-                repo_name = repo["full_name"]
-                pr_count = obter_numero_prs_fechados(repo_name)
-                if pr_count >= MIN_PRS_COUNT:
-                    repos.append(repo)
+            data = await fazer_consulta_graphql(session, CONSULTA_REPOSITORIOS, {"cursor": cursor})
+            search = data["search"]
+            for repo in search["nodes"]:
+                repo_name = repo["nameWithOwner"]
+                # A ordem da busca pode mudar entre páginas e repetir repositórios
+                if repo_name in vistos:
+                    continue
+                vistos.add(repo_name)
+                pr_count = repo["pullRequests"]["totalCount"]
+                if pr_count >= min_prs:
+                    repos.append(repo_name)
                     print(f"Repositório {repo_name} adicionado (total de PRs fechados/mesclados: {pr_count})")
                 if len(repos) >= quantidade:
                     break
-            page += 1
-        except requests.RequestException as e:
+            if not search["pageInfo"]["hasNextPage"]:
+                print("Não há mais repositórios na busca")
+                break
+            cursor = search["pageInfo"]["endCursor"]
+        except (aiohttp.ClientError, ErroGraphQL, KeyError, ValueError) as e:
             print(f"Erro ao buscar repositórios: {e}")
             break
+
+    if len(repos) >= quantidade:
+        salvar_repositorios(repos[:quantidade], min_prs)
     return repos[:quantidade]
 
 
-def obter_numero_prs_fechados(repo_name):
+def carregar_repositorios_salvos(quantidade, min_prs):
     """
-    Obtém o número de PRs fechados ou mesclados para um determinado repositório.
+    Carrega a lista de repositórios salva por uma execução anterior, se ela tiver sido gerada há menos de
+    CACHE_EXPIRE_AFTER segundos, com o mesmo mínimo de PRs e com repositórios suficientes. Caso contrário,
+    retorna None.
     """
+    if not os.path.exists(REPOS_CACHE_FILE):
+        return None
     try:
-        url = f"{BASE_URL}/repos/{repo_name}/pulls?state=closed&per_page=1"
-        response = fazer_requisicao_com_retry(url, HEADERS)
-        total_prs = response.headers.get("Link", "").split(",")[-1].split("&page=")[-1].split(">")[0]
-        return int(total_prs) if total_prs else 0
-    except Exception as e:
-        print(f"Erro ao obter número de PRs para o repositório {repo_name}: {e}")
-        return 0
+        with open(REPOS_CACHE_FILE, encoding="utf-8") as arquivo:
+            salvo = json.load(arquivo)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler {REPOS_CACHE_FILE}: {e}")
+        return None
+    if time.time() - salvo.get("saved_at", 0) > CACHE_EXPIRE_AFTER:
+        return None
+    if salvo.get("min_prs_count") != min_prs or len(salvo.get("repos", [])) < quantidade:
+        return None
+    return salvo["repos"][:quantidade]
+
+
+def salvar_repositorios(repos, min_prs):
+    """
+    Salva a lista de repositórios filtrados para ser reaproveitada nas próximas execuções.
+    """
+    with open(REPOS_CACHE_FILE, "w", encoding="utf-8") as arquivo:
+        json.dump({"saved_at": time.time(), "min_prs_count": min_prs, "repos": repos}, arquivo, indent=2)
 
 
-def main():
+async def resposta_cacheavel(response):
+    """
+    Indica se a resposta pode ir para o cache. O GitHub envia erros GraphQL (como RATE_LIMITED) com
+    status 200; guardá-los faria uma falha temporária se repetir por CACHE_EXPIRE_AFTER segundos.
+    Basta procurar a chave nos bytes, sem decodificar a resposta de novo: dentro de strings JSON as
+    aspas vêm escapadas, então '"errors":' só aparece como chave.
+    """
+    return b'"errors":' not in await response.read()
+
+
+def serializar_json(dados):
+    """
+    Serializa o corpo das requisições com orjson (o aiohttp espera uma str).
+    """
+    return orjson.dumps(dados).decode()
+
+
+def inteiro_positivo(valor):
+    """
+    Tipo do argparse que aceita apenas inteiros maiores ou iguais a 1.
+    """
+    numero = int(valor)
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"deve ser um inteiro maior ou igual a 1: {valor}")
+    return numero
+
+
+def ler_argumentos():
+    """
+    Lê os parâmetros da coleta da linha de comando, usando as constantes do módulo como padrão.
+    """
+    parser = argparse.ArgumentParser(description="Coleta dados de PRs dos repositórios mais populares do GitHub.")
+    parser.add_argument("--repos-limit", type=inteiro_positivo, default=REPOS_LIMIT,
+                        help=f"Quantidade de repositórios analisados (padrão: {REPOS_LIMIT})")
+    parser.add_argument("--prs-limit", type=inteiro_positivo, default=PRS_LIMIT,
+                        help=f"Quantidade de PRs coletados por repositório (padrão: {PRS_LIMIT})")
+    parser.add_argument("--min-prs", type=int, default=MIN_PRS_COUNT,
+                        help=f"Mínimo de PRs fechados ou mesclados por repositório (padrão: {MIN_PRS_COUNT})")
+    parser.add_argument("--csv-file", default=CSV_FILE,
+                        help=f"Arquivo CSV de saída (padrão: {CSV_FILE})")
+    return parser.parse_args()
+
+
+async def main(repos_limit=REPOS_LIMIT, prs_limit=PRS_LIMIT, min_prs=MIN_PRS_COUNT, csv_file=CSV_FILE):
     """
     Função principal que coordena a coleta de dados dos PRs e a escrita no arquivo CSV.
     """
-    repos = buscar_repositorios_populares()
-
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as csvfile:
-        fieldnames = ["repo_name", "pr_number", "num_files_changed", "lines_added", "lines_removed",
-                      "review_time_in_hours", "pr_description_length", "num_comments", "num_participants", "pr_status"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for repo_index, repo in enumerate(repos, 1):
-            repo_name = repo["full_name"]
-            print(f"Analisando repositório {repo_index}/{len(repos)}: {repo_name}")
-
-            page = 1
-            pr_count = 0
-            while pr_count < PRS_LIMIT:
-                pr_url = f"{BASE_URL}/repos/{repo_name}/pulls?state=closed&per_page=100&page={page}"
-                try:
-                    response = fazer_requisicao_com_retry(pr_url, HEADERS)
-                    prs = response.json()
-
-                    if not prs:
-                        print(f"Não há mais PRs para analisar em {repo_name}")
-                        break
-
-                    for pr in prs:
-                        print(f"Analisando PR #{pr['number']} de {repo_name}")
-                        pr_data = coletar_dados_pr(repo_name, pr)
-                        if pr_data:
-                            writer.writerow(pr_data)
-                            pr_count += 1
-                            if pr_count % 10 == 0:
-                                print(f"  Processados {pr_count} PRs de {repo_name}")
-
-                        if pr_count >= PRS_LIMIT:
-                            break
-
-                    page += 1
-
-                except Exception as e:
-                    print(f"Erro ao buscar PRs do repositório {repo_name}: {e}")
-                    break
+    # Um único pool de conexões keep-alive é reaproveitado por todas as requisições
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    # As consultas GraphQL são POST, por isso o cache também precisa aceitar esse método
+    cache = SQLiteBackend(cache_name=CACHE_FILE, expire_after=CACHE_EXPIRE_AFTER, allowed_methods=("GET", "POST"),
+                          filter_fn=resposta_cacheavel)
+    async with CachedSession(cache=cache, headers=HEADERS, connector=connector,
+                             json_serialize=serializar_json) as session:
+        repos = await buscar_repositorios_populares(session, repos_limit, min_prs)
+        await coletar_prs_repositorios(session, repos, csv_file, prs_limit, min_prs)
+
+    print(f"Análise concluída. Os dados foram salvos em {csv_file}")
+
+
+async def coletar_prs_repositorios(session, repos, csv_file=CSV_FILE, prs_limit=PRS_LIMIT, min_prs=MIN_PRS_COUNT):
+    """
+    Coleta os PRs dos repositórios em lotes, consultando vários repositórios em cada requisição GraphQL.
+    Se houver um checkpoint de uma execução interrompida, retoma a coleta a partir dele.
+    """
+    progresso = carregar_checkpoint(repos, csv_file, prs_limit, min_prs)
+    retomando = progresso is not None
+    if retomando:
+        print(f"Retomando a coleta: {len(progresso['done'])} repositórios já concluídos em {CHECKPOINT_FILE}")
+    else:
+        progresso = {"csv_file": csv_file, "prs_limit": prs_limit, "min_prs": min_prs, "repos": repos,
+                     "csv_offset": 0, "done": [], "partial": {}}
+    concluidos = set(progresso["done"])
+    pendentes = [repo_name for repo_name in repos if repo_name not in concluidos]
+
+    with open(csv_file, "r+" if retomando else "w", buffering=CSV_BUFFER_SIZE, newline="",
+              encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        if retomando:
+            # Descarta as linhas escritas depois do último checkpoint, que serão coletadas de novo
+            csvfile.seek(progresso["csv_offset"])
+            csvfile.truncate()
+        else:
+            writer.writerow(COLUNAS)
+
+        # A coleta produz as linhas na fila e uma única tarefa as escreve, sobrepondo rede e disco
+        fila = asyncio.Queue(maxsize=CSV_QUEUE_SIZE)
+        tarefa_escrita = asyncio.create_task(escrever_csv(fila, writer, csvfile, progresso))
+        # Os lotes são independentes entre si, então vários são coletados em paralelo
+        print(f"Analisando {len(pendentes)} repositórios em lotes de até {GRAPHQL_BATCH_SIZE}")
+        tarefa_coleta = asyncio.create_task(coletar_lotes(session, pendentes, fila, progresso, prs_limit))
+        try:
+            await asyncio.wait([tarefa_escrita, tarefa_coleta], return_when=asyncio.FIRST_COMPLETED)
+            if tarefa_escrita.done():
+                # A escrita só termina antes do sentinela se falhar: sem ela, a coleta travaria na fila cheia
+                tarefa_coleta.cancel()
+                await asyncio.gather(tarefa_coleta, return_exceptions=True)
+            else:
+                await tarefa_coleta
+        finally:
+            if not tarefa_escrita.done():
+                await fila.put(None)
+            # Propaga o erro da escrita, se houver
+            await tarefa_escrita
+
+    if set(repos) <= set(progresso["done"]):
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+    else:
+        print("Coleta incompleta. Execute novamente para coletar os repositórios pendentes")
+
+
+async def escrever_csv(fila, writer, csvfile, progresso):
+    """
+    Consome as rodadas da fila, em uma thread separada para que a escrita em disco não bloqueie as
+    requisições. Cada rodada traz suas linhas e o progresso dos repositórios correspondentes; o
+    progresso só é aplicado e salvo como checkpoint depois que as linhas da rodada estão no arquivo.
+    Termina ao receber None.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        rodada = await fila.get()
+        if rodada is None:
+            break
+        linhas, concluidos, parciais = rodada
+        await loop.run_in_executor(None, writer.writerows, linhas)
+        progresso["done"].extend(concluidos)
+        for repo_name in concluidos:
+            progresso["partial"].pop(repo_name, None)
+        progresso["partial"].update(parciais)
+        await loop.run_in_executor(None, salvar_checkpoint, progresso, csvfile)
 
-            print(f"  Total de PRs processados para {repo_name}: {pr_count}")
 
-    print(f"Análise concluída. Os dados foram salvos em {CSV_FILE}")
+def carregar_checkpoint(repos, csv_file, prs_limit, min_prs):
+    """
+    Carrega o checkpoint de uma execução interrompida, se ele corresponder à mesma lista de repositórios,
+    ao mesmo arquivo CSV e aos mesmos limites de PRs. Caso contrário, retorna None.
+    """
+    if not os.path.exists(CHECKPOINT_FILE) or not os.path.exists(csv_file):
+        return None
+    try:
+        with open(CHECKPOINT_FILE, encoding="utf-8") as arquivo:
+            progresso = json.load(arquivo)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler {CHECKPOINT_FILE}: {e}")
+        return None
+    if (progresso.get("csv_file") != csv_file or progresso.get("prs_limit") != prs_limit
+            or progresso.get("min_prs") != min_prs or progresso.get("repos") != repos):
+        return None
+    return progresso
+
+
+def salvar_checkpoint(progresso, csvfile):
+    """
+    Descarrega o CSV em disco e salva o progresso junto com o tamanho atual do arquivo.
+    O arquivo temporário + os.replace evita deixar um checkpoint corrompido se a execução cair no meio.
+    """
+    csvfile.flush()
+    progresso["csv_offset"] = csvfile.tell()
+    temporario = f"{CHECKPOINT_FILE}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(progresso, arquivo)
+    os.replace(temporario, CHECKPOINT_FILE)
+
+
+async def coletar_lotes(session, repo_names, fila, progresso, prs_limit=PRS_LIMIT):
+    """
+    Coleta os repositórios em lotes de GRAPHQL_BATCH_SIZE, vários ao mesmo tempo. Se um lote falhar
+    (ou a coleta for cancelada), o TaskGroup cancela os demais, para que nenhum fique bloqueado na fila.
+    """
+    async with asyncio.TaskGroup() as grupo:
+        for inicio in range(0, len(repo_names), GRAPHQL_BATCH_SIZE):
+            grupo.create_task(coletar_prs_lote(session, repo_names[inicio:inicio + GRAPHQL_BATCH_SIZE],
+                                               fila, progresso, prs_limit))
+
+
+async def coletar_prs_lote(session, repo_names, fila, progresso, prs_limit=PRS_LIMIT):
+    """
+    Coleta até prs_limit PRs válidos de cada repositório do lote, paginando (do mais recente para o
+    mais antigo) apenas os repositórios que ainda não atingiram o limite. Cada rodada vai para a fila
+    como um único item, com as linhas e o progresso dos repositórios do lote, para que o checkpoint
+    nunca se adiante às linhas escritas. No máximo MAX_CONCURRENT_BATCHES lotes são coletados ao
+    mesmo tempo.
+    """
+    async with SEMAFORO_LOTES:
+        print(f"Analisando lote de {len(repo_names)} repositórios a partir de {repo_names[0]}")
+        # O progresso salvo só é lido aqui; quem o atualiza é escrever_csv
+        salvos = progresso["partial"]
+        cursores = {repo_name: salvos.get(repo_name, {}).get("cursor") for repo_name in repo_names}
+        pr_counts = {repo_name: salvos.get(repo_name, {}).get("count", 0) for repo_name in repo_names}
+
+        while cursores:
+            query, variables = montar_consulta_prs(cursores, prs_limit)
+            try:
+                data = await fazer_consulta_graphql(session, query, variables)
+            except Exception as e:
+                print(f"Erro ao buscar PRs dos repositórios {', '.join(cursores)}: {e}")
+                break
+
+            linhas = []
+            concluidos = []
+            parciais = {}
+
+            for indice, repo_name in enumerate(list(cursores)):
+                # O repositório sai da resposta e só é referenciado dentro de processar_repositorio, então
+                # nada desta rodada continua em memória enquanto a próxima é baixada
+                pr_counts[repo_name], cursor = processar_repositorio(
+                    repo_name, data.pop(f"r{indice}", None), pr_counts[repo_name], linhas, prs_limit)
+                if cursor is None:
+                    del cursores[repo_name]
+                    concluidos.append(repo_name)
+                else:
+                    cursores[repo_name] = cursor
+                    parciais[repo_name] = {"cursor": cursor, "count": pr_counts[repo_name]}
+
+            await fila.put((linhas, concluidos, parciais))
+
+
+def processar_repositorio(repo_name, repositorio, pr_count, linhas, prs_limit=PRS_LIMIT):
+    """
+    Adiciona a `linhas` os PRs válidos de uma página de um repositório, até completar prs_limit.
+    Retorna o novo total de PRs do repositório e o cursor da próxima página, ou None se ele terminou.
+    """
+    if not repositorio:
+        print(f"Não foi possível obter os PRs de {repo_name}")
+        return pr_count, None
+
+    pull_requests = repositorio["pullRequests"]
+    for pr in reversed(pull_requests["nodes"]):
+        pr_data = coletar_dados_pr(repo_name, pr)
+        if pr_data:
+            linhas.append(pr_data)
+            pr_count += 1
+            if pr_count % 10 == 0:
+                print(f"  Processados {pr_count} PRs de {repo_name}")
+
+        if pr_count >= prs_limit:
+            break
+
+    page_info = pull_requests["pageInfo"]
+    if pr_count >= prs_limit or not page_info["hasPreviousPage"]:
+        if pr_count < prs_limit:
+            print(f"Não há mais PRs para analisar em {repo_name}")
+        print(f"  Total de PRs processados para {repo_name}: {pr_count}")
+        return pr_count, None
+    return pr_count, page_info["startCursor"]
 
 
 if __name__ == "__main__":
-    main()
+    argumentos = ler_argumentos()
+    asyncio.run(main(argumentos.repos_limit, argumentos.prs_limit, argumentos.min_prs, argumentos.csv_file))